@@ -1,4 +1,5 @@
-import json
+import hashlib
+import orjson
 import pandas as pd
 import numpy as np
 from typing import Dict, List, Any, Optional
@@ -8,6 +9,83 @@ import logging
 
 logging.basicConfig(level=logging.INFO)
 
+# Compiled once at import; these run for every program in a batch
+_TUITION_RE = re.compile(r'([\d,]+)')
+_YEAR_RE = re.compile(r'(\d+)\s*year')
+_MONTH_RE = re.compile(r'(\d+)\s*month')
+_USD_RE = re.compile(r'USD|\$')
+_GBP_RE = re.compile(r'GBP|£')
+
+# One pass over requirement text; scores are captured in lookaheads so a
+# keyword's trailing text stays available to the other alternatives; like
+# the old `.*?` patterns, a score must be on the same line as its keyword
+_LANG_RE = re.compile(
+    r'(?P<english>english)'
+    r'|toefl(?=[^\d\n]*(?P<toefl_min>\d+))'
+    r'|ielts(?=[^\d.\n]*(?P<ielts_min>[\d.]+))'
+    r'|duolingo(?=[^\d\n]*(?P<duolingo_min>\d+))'
+)
+_LANG_SCORE_TYPES = {'toefl_min': int, 'ielts_min': float, 'duolingo_min': int}
+
+# Rough conversion rates to EUR, indexed by currency code: 0 = EUR, 1 = USD, 2 = GBP
+_EUR_RATES = np.array([1.0, 0.85, 1.15])
+
+# Flat, human-readable columns for the programs CSV export
+_CSV_COLS = ['id', 'title', 'university', 'country', 'city', 'discipline',
+             'duration_months', 'tuition_eur', 'deadline', 'url']
+
+# Overviews are kept whole in memory and cut to this length on save
+_OVERVIEW_MAX_CHARS = 500
+
+# Number of best-scoring programs handed to AI matching
+_TOP_MATCHES = 50
+
+# Column layout of the score arrays built by calculate_match_scores_batch
+_SCORE_NAMES = ['academic_fit', 'financial_fit', 'location_fit', 'language_fit', 'overall_fit']
+_ACADEMIC, _FINANCIAL, _LOCATION, _LANGUAGE, _OVERALL = range(len(_SCORE_NAMES))
+
+_MATCH_WEIGHTS = {
+    'academic_fit': 0.3,
+    'financial_fit': 0.25,
+    'location_fit': 0.25,
+    'language_fit': 0.2
+}
+
+
+def _optional_ints(values: pd.Series) -> List[Optional[int]]:
+    """Convert a float Series to Python ints, mapping NaN to None"""
+    return [None if v != v else int(v) for v in values.tolist()]
+
+
+def _export_program(program: Dict) -> Dict:
+    """Program record as saved: a truncated copy only when the overview is too long"""
+    overview = program.get('overview')
+    if overview and len(overview) > _OVERVIEW_MAX_CHARS:
+        return {**program, 'overview': overview[:_OVERVIEW_MAX_CHARS]}
+    return program
+
+
+def _requirements_text(requirements: Any) -> Optional[str]:
+    """Flatten scraped requirements (list or string) into one CSV cell"""
+    if requirements is None or isinstance(requirements, str):
+        return requirements
+    return ' '.join(requirements)
+
+
+def _top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the rest"""
+    if len(scores) > k:
+        # Scores take few distinct values, so the k-th place is usually tied;
+        # like a stable sort, keep the earliest programs among the tied ones
+        threshold = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > threshold)
+        tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+        top_idx = np.concatenate([above, tied])
+    else:
+        top_idx = np.arange(len(scores))
+    return top_idx[np.argsort(-scores[top_idx], kind='stable')]
+
+
 class BachelorsDataProcessor:
     """Process scraped data for AI-powered university matching"""
     
@@ -24,8 +102,8 @@ class BachelorsDataProcessor:
     
     def load_scraped_data(self, filepath: str) -> Dict:
         """Load scraped data from JSON file"""
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(filepath, 'rb') as f:
+            return orjson.loads(f.read())
     
     def extract_tuition_amount(self, tuition_str: str) -> Optional[int]:
         """Extract numeric tuition amount from string"""
@@ -33,18 +111,20 @@ class BachelorsDataProcessor:
             return None
             
         # Remove currency symbols and extract numbers
-        numbers = re.findall(r'[\d,]+', tuition_str)
-        if numbers:
+        number = _TUITION_RE.search(tuition_str)
+        if number:
             # Take the first number and remove commas
-            amount = int(numbers[0].replace(',', ''))
+            amount = int(number.group(1).replace(',', ''))
             
             # Convert to EUR if needed (simplified)
-            if 'USD' in tuition_str or '$' in tuition_str:
-                amount = int(amount * 0.85)  # Rough USD to EUR
-            elif 'GBP' in tuition_str or '£' in tuition_str:
-                amount = int(amount * 1.15)  # Rough GBP to EUR
+            if _USD_RE.search(tuition_str):
+                currency = 1
+            elif _GBP_RE.search(tuition_str):
+                currency = 2
+            else:
+                currency = 0
                 
-            return amount
+            return int(amount * _EUR_RATES[currency])
         return None
     
     def parse_duration(self, duration_str: str) -> Optional[int]:
@@ -52,18 +132,43 @@ class BachelorsDataProcessor:
         if not duration_str or duration_str == 'N/A':
             return None
             
+        duration_str = duration_str.lower()
+        
         # Look for year patterns
-        year_match = re.search(r'(\d+)\s*year', duration_str.lower())
+        year_match = _YEAR_RE.search(duration_str)
         if year_match:
             return int(year_match.group(1)) * 12
             
         # Look for month patterns
-        month_match = re.search(r'(\d+)\s*month', duration_str.lower())
+        month_match = _MONTH_RE.search(duration_str)
         if month_match:
             return int(month_match.group(1))
             
         return None
     
+    def parse_numeric_fields(self, programs: List[Dict]) -> pd.DataFrame:
+        """Vectorized tuition/duration parsing for a batch of raw programs
+        
+        Mirrors extract_tuition_amount and parse_duration; missing values are NaN.
+        """
+        df = pd.DataFrame(programs, columns=['tuition_fee', 'duration'])
+        
+        fees = df['tuition_fee'].fillna('').astype(str)
+        amount = pd.to_numeric(
+            fees.str.extract(_TUITION_RE.pattern, expand=False).str.replace(',', '', regex=False),
+            errors='coerce'
+        )
+        currency = np.where(fees.str.contains(_USD_RE.pattern), 1, np.where(fees.str.contains(_GBP_RE.pattern), 2, 0))
+        
+        durations = df['duration'].fillna('').astype(str).str.lower()
+        years = pd.to_numeric(durations.str.extract(_YEAR_RE.pattern, expand=False))
+        months = pd.to_numeric(durations.str.extract(_MONTH_RE.pattern, expand=False))
+        
+        return pd.DataFrame({
+            'duration_months': (years * 12).fillna(months),
+            'tuition_eur': np.trunc(amount * _EUR_RATES[currency])
+        })
+    
     def extract_language_requirements(self, requirements: Any) -> Dict:
         """Extract language proficiency requirements"""
         lang_reqs = {
@@ -81,106 +186,109 @@ class BachelorsDataProcessor:
         else:
             return lang_reqs
         
-        req_text = req_text.lower()
-        
-        # Check for English requirement
-        if 'english' in req_text:
-            lang_reqs['english_required'] = True
-            
-        # Extract TOEFL score
-        toefl_match = re.search(r'toefl.*?(\d+)', req_text)
-        if toefl_match:
-            lang_reqs['toefl_min'] = int(toefl_match.group(1))
-            
-        # Extract IELTS score
-        ielts_match = re.search(r'ielts.*?([\d.]+)', req_text)
-        if ielts_match:
-            lang_reqs['ielts_min'] = float(ielts_match.group(1))
-            
-        # Extract Duolingo score
-        duolingo_match = re.search(r'duolingo.*?(\d+)', req_text)
-        if duolingo_match:
-            lang_reqs['duolingo_min'] = int(duolingo_match.group(1))
+        # First occurrence of each keyword wins
+        for match in _LANG_RE.finditer(req_text.lower()):
+            key = match.lastgroup
+            if key == 'english':
+                lang_reqs['english_required'] = True
+            elif lang_reqs[key] is None:
+                lang_reqs[key] = _LANG_SCORE_TYPES[key](match.group(key))
             
         return lang_reqs
     
-    def process_program(self, program: Dict) -> Dict:
-        """Process a single program for AI matching"""
+    def process_program(self, program: Dict, now_iso: Optional[str] = None) -> Dict:
+        """Process a single program for AI matching
+        
+        `now_iso` is the scraped_at fallback; it is only computed when needed.
+        """
+        if now_iso is None and 'scraped_at' not in program:
+            now_iso = datetime.now().isoformat()
+        return self._build_program(
+            program,
+            self.parse_duration(program.get('duration', '')),
+            self.extract_tuition_amount(program.get('tuition_fee', '')),
+            now_iso
+        )
+    
+    def _build_program(self, program: Dict, duration_months: Optional[int],
+                       tuition_eur: Optional[int], now_iso: Optional[str]) -> Dict:
+        """Assemble the processed program record from pre-parsed fields
+        
+        `now_iso` is the caller's timestamp, used when the program has no scraped_at.
+        """
+        program_id = program.get('url', '').rstrip('/').split('/')[-1]
+        if not program_id:
+            # Stable across runs, unlike hash(), so ids can key caches and dedup;
+            # university and city keep same-titled programs apart
+            identity = '\x1f'.join(str(program.get(k) or '') for k in ('title', 'university', 'city'))
+            program_id = f"prog_{hashlib.blake2b(identity.encode('utf-8'), digest_size=8).hexdigest()}"
         processed = {
-            'id': program.get('url', '').split('/')[-1] or f"prog_{hash(program['title'])}",
+            'id': program_id,
             'title': program.get('title', 'Unknown Program'),
             'university': program.get('university', 'Unknown University'),
             'country': program.get('country') or program.get('search_country', 'Unknown'),
             'city': program.get('city', 'Unknown'),
             'discipline': program.get('search_discipline', 'Unknown'),
-            'duration_months': self.parse_duration(program.get('duration', '')),
-            'tuition_eur': self.extract_tuition_amount(program.get('tuition_fee', '')),
+            'duration_months': duration_months,
+            'tuition_eur': tuition_eur,
             'deadline': program.get('deadline', 'N/A'),
             'url': program.get('url', ''),
-            'scraped_at': program.get('scraped_at', datetime.now().isoformat())
+            'scraped_at': program.get('scraped_at', now_iso)
         }
         
         # Process requirements if available
         if 'requirements' in program:
             processed['language_requirements'] = self.extract_language_requirements(program['requirements'])
-            processed['requirements_text'] = program['requirements'] if isinstance(program['requirements'], str) else ' '.join(program['requirements'])
+            processed['requirements'] = program['requirements']  # Joined only for the CSV export
         
-        # Process overview if available
+        # Process overview if available; truncated when saved
         if 'overview' in program:
-            processed['overview'] = program['overview'][:500]  # Limit length
+            processed['overview'] = program['overview']
             
         # Process subjects/specializations
         if 'subjects' in program:
             processed['specializations'] = program['subjects']
             
         # Add matching scores placeholders
-        processed['matching_scores'] = {
-            'academic_fit': 0.0,
-            'financial_fit': 0.0,
-            'location_fit': 0.0,
-            'language_fit': 0.0,
-            'overall_fit': 0.0
-        }
+        processed['matching_scores'] = dict.fromkeys(_SCORE_NAMES, 0.0)
         
         return processed
     
     def create_university_profile(self, programs: List[Dict]) -> Dict:
         """Create university profiles from program data"""
-        university_data = {}
+        if not programs:
+            return {}
         
-        for program in programs:
-            uni_name = program['university']
-            if uni_name not in university_data:
-                university_data[uni_name] = {
-                    'name': uni_name,
-                    'programs': [],
-                    'countries': set(),
-                    'cities': set(),
-                    'disciplines': set(),
-                    'min_tuition': float('inf'),
-                    'max_tuition': 0,
-                    'avg_tuition': []
-                }
-            
-            uni = university_data[uni_name]
-            uni['programs'].append(program['id'])
-            uni['countries'].add(program['country'])
-            uni['cities'].add(program['city'])
-            uni['disciplines'].add(program['discipline'])
-            
-            if program['tuition_eur']:
-                uni['min_tuition'] = min(uni['min_tuition'], program['tuition_eur'])
-                uni['max_tuition'] = max(uni['max_tuition'], program['tuition_eur'])
-                uni['avg_tuition'].append(program['tuition_eur'])
-        
-        # Finalize university profiles
-        for uni_name, uni in university_data.items():
-            uni['countries'] = list(uni['countries'])
-            uni['cities'] = list(uni['cities'])
-            uni['disciplines'] = list(uni['disciplines'])
-            uni['avg_tuition'] = np.mean(uni['avg_tuition']) if uni['avg_tuition'] else None
-            if uni['min_tuition'] == float('inf'):
-                uni['min_tuition'] = None
+        # object dtype keeps missing values as None rather than NaN
+        df = pd.DataFrame(programs, columns=['id', 'university', 'country', 'city', 'discipline', 'tuition_eur'],
+                          dtype=object)
+        # Zero/missing tuition does not count towards the tuition stats
+        df['tuition_eur'] = pd.to_numeric(df['tuition_eur']).replace(0, np.nan)
+        
+        g = df.groupby('university', sort=False, dropna=False)
+        members = g.agg({
+            'id': list,
+            'country': 'unique',
+            'city': 'unique',
+            'discipline': 'unique'
+        })
+        tuition = g['tuition_eur'].agg(['min', 'max', 'mean'])
+        
+        university_data = {}
+        for uni_name, row, tuition_row in zip(members.index, members.itertuples(index=False), tuition.itertuples(index=False)):
+            if uni_name != uni_name:  # groupby turns a missing university into NaN
+                uni_name = None
+            has_tuition = tuition_row.min == tuition_row.min  # NaN when no tuition known
+            university_data[uni_name] = {
+                'name': uni_name,
+                'programs': row.id,
+                'countries': row.country.tolist(),
+                'cities': row.city.tolist(),
+                'disciplines': row.discipline.tolist(),
+                'min_tuition': int(tuition_row.min) if has_tuition else None,
+                'max_tuition': int(tuition_row.max) if has_tuition else 0,
+                'avg_tuition': float(tuition_row.mean) if has_tuition else None
+            }
                 
         return university_data
     
@@ -215,60 +323,70 @@ class BachelorsDataProcessor:
     
     def calculate_basic_match_scores(self, user_profile: Dict, program: Dict) -> Dict:
         """Calculate basic matching scores (before AI enhancement)"""
-        scores = {}
+        user_scores = user_profile['academic']['test_scores']
+        row = self.calculate_match_scores_batch(
+            frozenset(user_profile['preferences']['countries']),
+            user_profile['preferences']['budget_eur'],
+            user_scores.get('toefl'),
+            user_scores.get('ielts'),
+            user_scores.get('duolingo'),
+            [program]
+        )[0]
+        return dict(zip(_SCORE_NAMES, row.tolist()))
+    
+    def calculate_match_scores_batch(self, pref_countries: frozenset, budget: Optional[float],
+                                     toefl: Optional[float], ielts: Optional[float],
+                                     duolingo: Optional[float], programs: List[Dict]) -> np.ndarray:
+        """Calculate basic matching scores for all programs at once
         
-        # Academic fit (simplified)
-        scores['academic_fit'] = 0.5  # Base score
+        Academic fit is a flat base score; financial fit decreases gradually
+        with how much a program is over budget; location fit favours the
+        preferred countries; language fit passes if any test with both a
+        requirement and a user score meets the requirement.
         
-        # Financial fit
-        if program['tuition_eur'] and user_profile['preferences']['budget_eur']:
-            if program['tuition_eur'] <= user_profile['preferences']['budget_eur']:
-                scores['financial_fit'] = 1.0
-            else:
-                # Gradually decrease score based on how much over budget
-                over_budget_ratio = program['tuition_eur'] / user_profile['preferences']['budget_eur']
-                scores['financial_fit'] = max(0, 1 - (over_budget_ratio - 1) * 0.5)
-        else:
-            scores['financial_fit'] = 0.5
+        Returns an (n_programs, len(_SCORE_NAMES)) array; index columns with
+        _ACADEMIC, _FINANCIAL, _LOCATION, _LANGUAGE and _OVERALL.
+        """
+        n = len(programs)
         
-        # Location fit
-        if program['country'] in user_profile['preferences']['countries']:
-            scores['location_fit'] = 1.0
-        else:
-            scores['location_fit'] = 0.3
-        
-        # Language fit
-        lang_req = program.get('language_requirements', {})
-        user_scores = user_profile['academic']['test_scores']
+        # Stage per-program inputs as flat arrays; 0 stands in for "missing"
+        tuition = np.fromiter((p['tuition_eur'] or 0 for p in programs), dtype=np.float64, count=n)
+        country_ok = np.fromiter(
+            (p['country'] in pref_countries for p in programs), dtype=bool, count=n
+        )
+        lang_reqs = np.array([
+            (req.get('english_required', False), req.get('toefl_min') or 0,
+             req.get('ielts_min') or 0, req.get('duolingo_min') or 0)
+            for req in (p.get('language_requirements', {}) for p in programs)
+        ], dtype=np.float64).reshape(n, 4)
+        user_tests = np.array([toefl or 0, ielts or 0, duolingo or 0], dtype=np.float64)
         
-        if lang_req.get('english_required'):
-            language_matches = []
-            
-            if lang_req.get('toefl_min') and user_scores.get('toefl'):
-                language_matches.append(user_scores['toefl'] >= lang_req['toefl_min'])
-            
-            if lang_req.get('ielts_min') and user_scores.get('ielts'):
-                language_matches.append(user_scores['ielts'] >= lang_req['ielts_min'])
-                
-            if lang_req.get('duolingo_min') and user_scores.get('duolingo'):
-                language_matches.append(user_scores['duolingo'] >= lang_req['duolingo_min'])
-            
-            if language_matches:
-                scores['language_fit'] = 1.0 if any(language_matches) else 0.2
-            else:
-                scores['language_fit'] = 0.5  # No specific requirement found
+        # Financial fit: decreases gradually with how much over budget
+        if budget:
+            financial = np.where(
+                tuition == 0, 0.5,
+                np.where(tuition <= budget, 1.0, np.maximum(0, 1 - (tuition / budget - 1) * 0.5))
+            )
         else:
-            scores['language_fit'] = 1.0  # No language requirement
-        
-        # Calculate overall fit
-        weights = {
-            'academic_fit': 0.3,
-            'financial_fit': 0.25,
-            'location_fit': 0.25,
-            'language_fit': 0.2
-        }
+            financial = np.full(n, 0.5)
         
-        scores['overall_fit'] = sum(scores[key] * weights[key] for key in weights)
+        # Language fit: any test with both a requirement and a user score counts
+        test_mins = lang_reqs[:, 1:]
+        comparable = (test_mins != 0) & (user_tests != 0)
+        passed = comparable & (user_tests >= test_mins)
+        language = np.where(
+            lang_reqs[:, 0] == 0, 1.0,
+            np.where(comparable.any(axis=1), np.where(passed.any(axis=1), 1.0, 0.2), 0.5)
+        )
+        
+        scores = np.empty((n, len(_SCORE_NAMES)))
+        scores[:, _ACADEMIC] = 0.5
+        scores[:, _FINANCIAL] = financial
+        scores[:, _LOCATION] = np.where(country_ok, 1.0, 0.3)
+        scores[:, _LANGUAGE] = language
+        scores[:, _OVERALL] = sum(
+            scores[:, _SCORE_NAMES.index(key)] * weight for key, weight in _MATCH_WEIGHTS.items()
+        )
         
         return scores
     
@@ -277,29 +395,41 @@ class BachelorsDataProcessor:
         
         # Process programs
         programs = scraped_data.get('programs', [])
-        processed_programs = []
+        now_iso = datetime.now().isoformat()  # One timestamp for the whole batch
         
-        for program in programs:
-            processed = self.process_program(program)
-            
-            # Calculate basic match scores if user profile provided
-            if sample_user_profile:
-                processed['matching_scores'] = self.calculate_basic_match_scores(
-                    sample_user_profile, processed
-                )
+        parsed = self.parse_numeric_fields(programs)
+        processed_programs = [
+            self._build_program(program, duration_months, tuition_eur, now_iso)
+            for program, duration_months, tuition_eur in zip(
+                programs,
+                _optional_ints(parsed['duration_months']),
+                _optional_ints(parsed['tuition_eur'])
+            )
+        ]
+        
+        # Calculate basic match scores if user profile provided
+        if sample_user_profile:
+            # Look up user fields once for the whole batch
+            scores = self.calculate_match_scores_batch(
+                frozenset(sample_user_profile.get('preferred_countries', [])),
+                sample_user_profile.get('budget_range') or 0,
+                sample_user_profile.get('toefl_score'),
+                sample_user_profile.get('ielts_score'),
+                sample_user_profile.get('duolingo_score'),
+                processed_programs
+            )
+            for processed, row in zip(processed_programs, scores.tolist()):
+                processed['matching_scores'] = dict(zip(_SCORE_NAMES, row))
             
-            processed_programs.append(processed)
+            # Only the best matches need ordering; programs keep their scraped order
+            top_programs = [
+                processed_programs[i]
+                for i in _top_k_indices(scores[:, _OVERALL], _TOP_MATCHES)
+            ]
         
         # Create university profiles
         university_profiles = self.create_university_profile(processed_programs)
         
-        # Sort programs by overall fit if scores calculated
-        if sample_user_profile:
-            processed_programs.sort(
-                key=lambda x: x['matching_scores']['overall_fit'], 
-                reverse=True
-            )
-        
         # Prepare final output
         output = {
             'metadata': {
@@ -307,29 +437,46 @@ class BachelorsDataProcessor:
                 'total_universities': len(university_profiles),
                 'countries': list(set(p['country'] for p in processed_programs)),
                 'disciplines': list(set(p['discipline'] for p in processed_programs)),
-                'processed_at': datetime.now().isoformat()
+                'processed_at': now_iso
             },
             'programs': processed_programs,
             'universities': university_profiles
         }
         
         if sample_user_profile:
-            output['matching_data'] = self.prepare_for_ai_matching(
-                sample_user_profile, processed_programs[:50]  # Top 50 matches
-            )
+            output['matching_data'] = self.prepare_for_ai_matching(sample_user_profile, top_programs)
         
         return output
     
     def save_processed_data(self, data: Dict, output_file: str):
         """Save processed data for AI consumption"""
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        export = dict(data)
+        if 'programs' in data:
+            export['programs'] = [_export_program(p) for p in data['programs']]
+        if 'matching_data' in data:
+            export['matching_data'] = {
+                **data['matching_data'],
+                'programs': [_export_program(p) for p in data['matching_data']['programs']]
+            }
+        
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(
+                export,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            ))
         
         logging.info(f"Processed data saved to {output_file}")
         
         # Also save a CSV version of programs for easy viewing
         if 'programs' in data:
-            df = pd.DataFrame(data['programs'])
+            df = pd.DataFrame(
+                [
+                    {**{k: p.get(k) for k in _CSV_COLS}, 'requirements_text': _requirements_text(p.get('requirements'))}
+                    for p in data['programs']
+                ],
+                columns=_CSV_COLS + ['requirements_text']
+            )
+            df = df.astype({'duration_months': 'Int64', 'tuition_eur': 'Int64'})
             csv_file = output_file.replace('.json', '_programs.csv')
             df.to_csv(csv_file, index=False)
             logging.info(f"Programs CSV saved to {csv_file}")
@@ -367,7 +514,7 @@ if __name__ == "__main__":
         # Print top matches
         print("\nTop 10 Matches for User:")
         print("-" * 80)
-        for i, program in enumerate(processed_data['programs'][:10], 1):
+        for i, program in enumerate(processed_data['matching_data']['programs'][:10], 1):
             print(f"{i}. {program['title']}")
             print(f"   University: {program['university']}")
             print(f"   Country: {program['country']}")
@@ -1,8 +1,13 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+import soupsieve as sv
 import json
 import time
 import csv
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, urlparse, parse_qs
 import logging
 from datetime import datetime
@@ -14,10 +19,60 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Prefer the C-backed lxml parser; fall back to the stdlib one when it is not installed
+try:
+    import lxml  # noqa: F401
+    _HTML_PARSER = 'lxml'
+except ImportError:
+    _HTML_PARSER = 'html.parser'
+
+# Persist fetched pages across runs when requests-cache is installed
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+# Program card discovery and field selectors, compiled once at import.
+# Card layouts are alternatives: only the first layout with any match on the page is used
+_CARD_SELS = (
+    sv.compile('div.ProgramCard'),
+    sv.compile('article.program-card'),
+    sv.compile('div[data-role="ProgramCard"]')
+)
+# Field alternatives are tried in priority order, as in the find() or find() chains they replace
+_TITLE_SELS = (sv.compile('h3'), sv.compile('h2'), sv.compile('a.title'))
+_UNI_SELS = (sv.compile('a.university'), sv.compile('span.institution'))
+_LOCATION_SELS = (sv.compile('span.location'), sv.compile('div.location'))
+_LINK_SEL = sv.compile('a[href]')
+_DURATION_SEL = sv.compile('span.duration')
+_FEE_SELS = (sv.compile('span.tuition'), sv.compile('div.fee'))
+_DEADLINE_SELS = (sv.compile('span.deadline'), sv.compile('div.deadline'))
+
+
+def _select_first(tag, selectors):
+    """Match of the first selector in `selectors` that finds anything under `tag`"""
+    for selector in selectors:
+        elem = selector.select_one(tag)
+        if elem is not None:
+            return elem
+    return None
+
+
+def _text(elem, default='N/A'):
+    """Stripped text of an element, or `default` when missing"""
+    return elem.get_text().strip() if elem else default
+
+
 class BachelorsPortalScraper:
-    def __init__(self):
+    def __init__(self, cache_name='scrape_cache', cache_expire_after=86400):
         self.base_url = "https://www.bachelorsportal.com"
-        self.session = requests.Session()
+        if requests_cache and cache_name:
+            # SQLite-backed; repeated listing and detail URLs are served from disk
+            self.session = requests_cache.CachedSession(
+                cache_name, backend='sqlite', expire_after=cache_expire_after
+            )
+        else:
+            self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -27,23 +82,36 @@ class BachelorsPortalScraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         })
+        # Pooled keep-alive connections; urllib3 retries transient failures with exponential backoff
+        retry = Retry(
+            total=3,
+            backoff_factor=1.0,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET']
+        )
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.programs_data = []
         self.universities_data = {}
+        # Per-thread flag set by get_page whenever a request reaches the site
+        # rather than the cache; workers only pause after live requests
+        self._network = threading.local()
+        # Details already scraped this session, keyed by program URL
+        self.program_details = {}
         
-    def get_page(self, url, retry_count=3):
-        """Fetch a page with retry logic"""
-        for attempt in range(retry_count):
-            try:
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                return response
-            except requests.exceptions.RequestException as e:
-                logging.warning(f"Attempt {attempt + 1} failed for {url}: {str(e)}")
-                if attempt < retry_count - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                else:
-                    logging.error(f"Failed to fetch {url} after {retry_count} attempts")
-                    return None
+    def get_page(self, url):
+        """Fetch a page; retries are handled by the session's adapter"""
+        try:
+            response = self.session.get(url, timeout=30)
+            if not getattr(response, 'from_cache', False):
+                self._network.used = True
+            response.raise_for_status()
+            return response
+        except requests.exceptions.RequestException as e:
+            self._network.used = True
+            logging.error(f"Failed to fetch {url}: {str(e)}")
+            return None
     
     def search_programs(self, country=None, discipline=None, page=1, max_pages=5):
         """Search for bachelor programs with filters"""
@@ -76,7 +144,7 @@ class BachelorsPortalScraper:
             if not response:
                 continue
                 
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(response.content, _HTML_PARSER)
             programs = self.extract_programs_from_listing(soup)
             
             if not programs:
@@ -86,8 +154,9 @@ class BachelorsPortalScraper:
             all_programs.extend(programs)
             logging.info(f"Extracted {len(programs)} programs from page {current_page}")
             
-            # Respectful delay between requests
-            time.sleep(2)
+            # Respectful delay between requests; pages served from the cache never hit the site
+            if not getattr(response, 'from_cache', False):
+                time.sleep(2)
             
         return all_programs
     
@@ -96,44 +165,42 @@ class BachelorsPortalScraper:
         programs = []
         
         # Find program cards (adjust selectors based on actual HTML structure)
-        program_cards = soup.find_all('div', class_='ProgramCard') or \
-                       soup.find_all('article', class_='program-card') or \
-                       soup.find_all('div', {'data-role': 'ProgramCard'})
+        program_cards = next((cards for cards in (sel.select(soup) for sel in _CARD_SELS) if cards), [])
         
         for card in program_cards:
             try:
                 program = {}
                 
                 # Extract title
-                title_elem = card.find('h3') or card.find('h2') or card.find('a', class_='title')
-                program['title'] = title_elem.text.strip() if title_elem else 'N/A'
+                title_elem = _select_first(card, _TITLE_SELS)
+                program['title'] = _text(title_elem)
                 
                 # Extract university
-                uni_elem = card.find('a', class_='university') or card.find('span', class_='institution')
-                program['university'] = uni_elem.text.strip() if uni_elem else 'N/A'
+                uni_elem = _select_first(card, _UNI_SELS)
+                program['university'] = _text(uni_elem)
                 
                 # Extract location
-                location_elem = card.find('span', class_='location') or card.find('div', class_='location')
+                location_elem = _select_first(card, _LOCATION_SELS)
                 if location_elem:
-                    program['city'] = location_elem.text.strip()
+                    program['city'] = _text(location_elem)
                     program['country'] = location_elem.get('data-country', 'N/A')
                 
                 # Extract program URL
-                link_elem = card.find('a', href=True)
+                link_elem = _LINK_SEL.select_one(card)
                 if link_elem:
                     program['url'] = urljoin(self.base_url, link_elem['href'])
                 
                 # Extract duration
-                duration_elem = card.find('span', class_='duration') or card.find('div', string=lambda x: x and 'years' in x)
-                program['duration'] = duration_elem.text.strip() if duration_elem else 'N/A'
+                duration_elem = _DURATION_SEL.select_one(card) or card.find('div', string=lambda x: x and 'years' in x)
+                program['duration'] = _text(duration_elem)
                 
                 # Extract tuition fee
-                fee_elem = card.find('span', class_='tuition') or card.find('div', class_='fee')
-                program['tuition_fee'] = fee_elem.text.strip() if fee_elem else 'N/A'
+                fee_elem = _select_first(card, _FEE_SELS)
+                program['tuition_fee'] = _text(fee_elem)
                 
                 # Extract application deadline
-                deadline_elem = card.find('span', class_='deadline') or card.find('div', class_='deadline')
-                program['deadline'] = deadline_elem.text.strip() if deadline_elem else 'N/A'
+                deadline_elem = _select_first(card, _DEADLINE_SELS)
+                program['deadline'] = _text(deadline_elem)
                 
                 programs.append(program)
                 
@@ -149,7 +216,7 @@ class BachelorsPortalScraper:
         if not response:
             return None
             
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(response.content, _HTML_PARSER)
         details = {}
         
         try:
@@ -202,7 +269,7 @@ class BachelorsPortalScraper:
         if not response:
             return []
             
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(response.content, _HTML_PARSER)
         countries = []
         
         # Find country links
@@ -227,7 +294,7 @@ class BachelorsPortalScraper:
         if not response:
             return []
             
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(response.content, _HTML_PARSER)
         disciplines = []
         
         # Find discipline links
@@ -264,8 +331,50 @@ class BachelorsPortalScraper:
         logging.info(f"Data saved to {filepath}")
         return filepath
     
-    def run_targeted_scrape(self, countries=None, disciplines=None, max_programs=100):
-        """Run a targeted scrape for specific countries and disciplines"""
+    def _search_combination(self, country, discipline, stop):
+        """Search one country/discipline pair and tag results with the search metadata
+        
+        The pause after a worker's live search is taken before its next search,
+        so results are handed back without waiting and no search starts once
+        `stop` is set.
+        """
+        if getattr(self._network, 'pause_before_search', False):
+            time.sleep(3)  # Respectful delay
+        if stop.is_set():
+            return []
+        
+        logging.info(f"Scraping programs for {country} - {discipline}")
+        self._network.used = False
+        programs = self.search_programs(
+            country=country,
+            discipline=discipline,
+            max_pages=2  # Limit pages per search
+        )
+        
+        # Add metadata
+        for program in programs:
+            program['search_country'] = country
+            program['search_discipline'] = discipline
+            program['scraped_at'] = datetime.now().isoformat()
+            
+        self._network.pause_before_search = self._network.used
+        return programs
+    
+    def _scrape_details_delayed(self, program_url):
+        """Fetch program details, then pause before the worker's next live request"""
+        logging.info(f"Scraping details for program: {program_url}")
+        self._network.used = False
+        details = self.scrape_program_details(program_url)
+        if self._network.used:
+            time.sleep(2)
+        return details
+    
+    def run_targeted_scrape(self, countries=None, disciplines=None, max_programs=100, max_workers=4):
+        """Run a targeted scrape for specific countries and disciplines
+        
+        Searches and detail pages are fetched by `max_workers` threads sharing the
+        session's connection pool; each worker keeps the per-request delays.
+        """
         all_programs = []
         
         if not countries:
@@ -278,42 +387,40 @@ class BachelorsPortalScraper:
             disciplines_list = self.scrape_disciplines()
             disciplines = [d['name'] for d in disciplines_list[:10]]  # Top 10 disciplines
         
-        # Scrape programs for each combination
-        for country in countries:
-            for discipline in disciplines:
-                logging.info(f"Scraping programs for {country} - {discipline}")
-                programs = self.search_programs(
-                    country=country,
-                    discipline=discipline,
-                    max_pages=2  # Limit pages per search
-                )
-                
-                # Add metadata
-                for program in programs:
-                    program['search_country'] = country
-                    program['search_discipline'] = discipline
-                    program['scraped_at'] = datetime.now().isoformat()
-                
-                all_programs.extend(programs)
+        # Scrape programs for each combination, collecting results in combination order
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._search_combination, country, discipline, stop)
+                for country in countries
+                for discipline in disciplines
+            ]
+            for future in futures:
+                all_programs.extend(future.result())
                 
                 if len(all_programs) >= max_programs:
+                    # Drop queued searches and keep waiting workers from fetching
+                    stop.set()
+                    for pending in futures:
+                        pending.cancel()
                     break
-                    
-                time.sleep(3)  # Respectful delay
-                
-            if len(all_programs) >= max_programs:
-                break
         
         # Scrape additional details for subset of programs
-        detailed_programs = []
-        for i, program in enumerate(all_programs[:20]):  # Detail for first 20
-            if 'url' in program:
-                logging.info(f"Scraping details for program {i+1}/20: {program['title']}")
-                details = self.scrape_program_details(program['url'])
+        detailed_programs = [p for p in all_programs[:20] if 'url' in p]  # Detail for first 20
+        
+        # Fetch each URL once; cross-listed programs and repeat runs reuse earlier details
+        new_urls = list(dict.fromkeys(
+            p['url'] for p in detailed_programs if p['url'] not in self.program_details
+        ))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for url, details in zip(new_urls, executor.map(self._scrape_details_delayed, new_urls)):
                 if details:
-                    program.update(details)
-                detailed_programs.append(program)
-                time.sleep(2)
+                    self.program_details[url] = details
+        
+        for program in detailed_programs:
+            details = self.program_details.get(program['url'])
+            if details:
+                program.update(details)
         
         return {
             'programs': all_programs,